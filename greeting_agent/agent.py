@@ -1,7 +1,19 @@
+import asyncio
+import contextvars
 import datetime
+import functools
+import hashlib
+import json
 import os
 import logging
-import sys # For graceful exit
+import queue
+import re
+import string
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
@@ -11,36 +23,200 @@ load_dotenv()
 from google.adk.agents import LlmAgent
 from google.adk.tools import FunctionTool
 from google.adk.runners import Runner
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.genai import types
 # Using the import path from the google-generativeai library for safety settings
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
 # Libraries for external data retrieval
 import requests
+import httplib2
+import orjson
 from googleapiclient.discovery import build
+from googleapiclient.model import JsonModel
 import googleapiclient.errors # Import for specific error handling
 
 # Configure basic logging for ADK events and debugging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# The client is built with cache_discovery=False; keep googleapiclient's discovery cache chatter out of the log
+logging.getLogger("googleapiclient.discovery_cache").setLevel(logging.WARNING)
 
 # --- Retrieve Environment Variables ---
 # ADK automatically picks up GOOGLE_CLOUD_PROJECT, GOOGLE_CLOUD_LOCATION, etc.,
 # but explicitly getting API keys for specific tools (like CSE) is necessary.
 GOOGLE_CSE_API_KEY = os.getenv("GOOGLE_CSE_API_KEY")
 GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID")
+# Set GREETING_AGENT_OFFLINE=1 to reuse today's cached greeting instead of calling the model again
+GREETING_AGENT_OFFLINE = os.getenv("GREETING_AGENT_OFFLINE") == "1"
 
-# --- Initial Environment Variable Check ---
-if not GOOGLE_CSE_API_KEY or not GOOGLE_CSE_ID:
-    logging.error("Missing GOOGLE_CSE_API_KEY or GOOGLE_CSE_ID in your .env file. "
-                  "Please ensure these are set for the Google Custom Search tool to function.")
-    sys.exit(1) # Exit if critical variables are missing
+# --- Environment Variable Check ---
+# Checked when a search is first made rather than at import, so the module can be
+# imported (by tooling, tests or ADK itself) without Custom Search credentials.
+def _require_cse_env() -> None:
+    """Raises RuntimeError if the Custom Search credentials are not configured."""
+    if not GOOGLE_CSE_API_KEY or not GOOGLE_CSE_ID:
+        raise RuntimeError("Missing GOOGLE_CSE_API_KEY or GOOGLE_CSE_ID in your .env file. "
+                           "Please ensure these are set for the Google Custom Search tool to function.")
+
+# --- Search Result Cache ---
+# The special days for a given "Month Day" barely change between runs, so search results
+# are kept on disk for a day. A cache hit skips the Custom Search round-trip and its quota unit.
+# Generated greetings are stored here too, for GREETING_AGENT_OFFLINE runs.
+CACHE_DIR = Path(os.getenv("GREETING_AGENT_CACHE_DIR", "~/.cache/greeting-agent")).expanduser()
+CACHE_TTL_SECONDS = 24 * 60 * 60
+
+def _normalize_query(date_query: str) -> str:
+    """Normalizes a date query (e.g. " May  21 " -> "may 21") so equivalent queries share a cache entry."""
+    return " ".join(date_query.lower().split())
+
+def _cache_path(key: str, namespace: str) -> Path:
+    """
+    Maps a cache key to its JSON file inside CACHE_DIR. The file is named after a digest
+    of the key, so distinct keys never share an entry, prefixed by the readable namespace.
+    """
+    return CACHE_DIR / f"{namespace}-{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+
+def _load_cached(key: str, namespace: str = "search"):
+    """Returns the cached value for `key`, or None if it is missing, unreadable or older than the TTL."""
+    path = _cache_path(key, namespace)
+    try:
+        if os.path.getmtime(path) <= time.time() - CACHE_TTL_SECONDS:
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _store_cached(key: str, value, namespace: str = "search") -> None:
+    """Writes `value` to the cache. Failures are logged and otherwise ignored, the cache is best-effort."""
+    path = _cache_path(key, namespace)
+    tmp_path = None
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file unique to this write, then swap it in, so concurrent
+        # writers (threads or processes) never share a file and readers never see a partial entry
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=CACHE_DIR,
+                                         suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning("Could not write cache entry '%s': %s", path, e)
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+# --- Custom Search Client ---
+# Building the client re-reads the discovery document and sets up a new transport,
+# so it is built once on first use and shared by every subsequent search.
+# httplib2.Http keeps the connection to googleapis.com open, so repeat searches
+# skip the TCP and TLS handshakes. It is not thread-safe, so each worker thread
+# gets its own and passes it to execute().
+CSE_HTTP_TIMEOUT_SECONDS = 5
+_CSE_SERVICE = None
+_CSE_SERVICE_LOCK = threading.Lock()
+_THREAD_LOCAL = threading.local()
+
+# Worker threads for the blocking search calls. When the model issues several tool
+# calls in one turn, ADK awaits them together and they run side by side here.
+_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="cse-search")
+
+class _OrjsonModel(JsonModel):
+    """JsonModel that parses response bodies with orjson instead of the stdlib json module."""
+
+    def deserialize(self, content):
+        body = orjson.loads(content)
+        if self._data_wrapper and "data" in body:
+            body = body["data"]
+        return body
+
+def _get_thread_http() -> httplib2.Http:
+    """Returns the calling thread's keep-alive HTTP transport, creating it on first use."""
+    http = getattr(_THREAD_LOCAL, "http", None)
+    if http is None:
+        http = _THREAD_LOCAL.http = httplib2.Http(timeout=CSE_HTTP_TIMEOUT_SECONDS)
+    return http
+
+def _get_cse_service():
+    """
+    Returns the shared Custom Search client, building it on first use.
+    Raises RuntimeError if the Custom Search credentials are missing.
+    """
+    global _CSE_SERVICE
+    if _CSE_SERVICE is None:
+        _require_cse_env()
+        with _CSE_SERVICE_LOCK:
+            if _CSE_SERVICE is None:
+                # cache_discovery=False skips the discovery file-cache lookup (and its warning)
+                _CSE_SERVICE = build("customsearch", "v1", developerKey=GOOGLE_CSE_API_KEY,
+                                     http=_get_thread_http(), model=_OrjsonModel(),
+                                     cache_discovery=False)
+    return _CSE_SERVICE
+
+# --- Speculative Prefetch ---
+# The agent is instructed to always look up today's "Month Day", so that search is
+# started before the model asks for it and the tool call is served from the result.
+# Prefetches only live for one run_daily_check; whatever the run did not consume is
+# discarded, so a later run (possibly on another day) never gets a stale result.
+PREFETCH_TIMEOUT_SECONDS = 5
+_PREFETCHED = {}  # normalized date query -> Future of _search_special_days
+
+def _prefetch_special_days(date_query: str) -> None:
+    """Starts searching for `date_query` in the background, unless that is already under way."""
+    key = _normalize_query(date_query)
+    if key not in _PREFETCHED:
+        logging.info("Prefetching special days for '%s'", key)
+        _PREFETCHED[key] = _EXECUTOR.submit(_search_special_days, date_query)
+
+def _discard_prefetched() -> None:
+    """Drops all prefetches that no tool call has consumed."""
+    for future in _PREFETCHED.values():
+        future.cancel()  # No-op if already running; its result still lands in the disk cache
+    _PREFETCHED.clear()
+
+async def _await_prefetched(date_query: str):
+    """
+    Returns the prefetched results for `date_query`, or None if there was no prefetch
+    or it failed or did not finish within PREFETCH_TIMEOUT_SECONDS.
+    """
+    future = _PREFETCHED.pop(_normalize_query(date_query), None)
+    if future is None:
+        return None
+    try:
+        results = await asyncio.wait_for(asyncio.wrap_future(future), PREFETCH_TIMEOUT_SECONDS)
+    except Exception as e:
+        logging.warning("Prefetch for '%s' unusable, searching again: %r", date_query, e)
+        return None
+    logging.info("Serving '%s' from prefetch.", date_query)
+    return results
+
+async def _run_blocking(func, *args):
+    """Runs a blocking helper on the search executor without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_EXECUTOR, func, *args)
+
+# The daily-check run (a _DailyCheckRun) the current tool call belongs to, if any. ADK runs
+# tool coroutines in tasks that inherit the run's context, so a tool can report back to it.
+_CURRENT_RUN = contextvars.ContextVar("current_run", default=None)
+
+def _note_search_succeeded(date_queries) -> None:
+    """Marks the current run's search as successful if one of `date_queries` is today's query."""
+    run = _CURRENT_RUN.get()
+    if run is not None and any(_normalize_query(q) == run.search_cache_key for q in date_queries):
+        run.search_succeeded = True
 
 # --- 3. Tool Definition: Your External Data Connector ---
-def get_special_day_info_from_external_source(date_query: str) -> dict:
+async def get_special_day_info_from_external_source(date_query: str) -> dict:
     """
     TOOL: This function retrieves real-time information about special or
     international days for a given date from an external source (Google Custom Search).
     It is designed to be called by the ADK agent.
 
+    The blocking search runs in a worker thread, so the ADK runner's event loop
+    stays free to stream model output or run other tools while it waits.
+
     Args:
         date_query (str): The date string (e.g., "May 21") that the LLM will
                           provide to this tool.
@@ -51,52 +227,254 @@ def get_special_day_info_from_external_source(date_query: str) -> dict:
               In case of API error, it logs the error but still returns an empty dict
               so the agent can gracefully respond that it couldn't find information.
     """
-    logging.info(f"TOOL CALL: 'get_special_day_info_from_external_source' called with query: '{date_query}'")
+    logging.info("TOOL CALL: 'get_special_day_info_from_external_source' called with query: '%s'", date_query)
     results = {}
 
     try:
-        results = _search_special_days(date_query)
+        prefetched = await _await_prefetched(date_query)
+        if prefetched is not None:
+            results = prefetched
+        else:
+            results = await _run_blocking(_search_special_days, date_query)
+        _note_search_succeeded([date_query])
     except Exception as e:
         # Catch any exception from _search_special_days and log it.
         # Returning an empty dict indicates no info could be retrieved.
-        logging.error(f"Error fetching special day info via tool for '{date_query}': {e}")
+        logging.error("Error fetching special day info via tool for '%s': %s", date_query, e)
         pass # The error is logged, and results remains empty.
 
     return results
 
-def _search_special_days(date_query: str) -> dict:
+async def get_special_day_info_batch(date_queries: list[str]) -> dict:
     """
-    Helper function to retrieve special day information from Google Custom Search API.
-    Raises exceptions on API errors, which are caught by the calling tool function.
+    TOOL: Batch variant of 'get_special_day_info_from_external_source'. Looks up
+    several date queries (e.g. "May 21", "May 21 India", "May 21 awareness") in a
+    single Custom Search batch request instead of one round-trip per query.
+
+    Args:
+        date_queries (list[str]): The date strings the LLM wants to look up.
+
+    Returns:
+        dict: Maps each query to a dictionary of day titles and descriptions.
+              A day already listed under an earlier query is not repeated.
+              On an API error the affected queries map to an empty dict.
     """
-    results = {}
-    logging.info("Attempting to use Google Custom Search API for special days...")
-    service = build("customsearch", "v1", developerKey=GOOGLE_CSE_API_KEY)
+    logging.info("TOOL CALL: 'get_special_day_info_batch' called with queries: %s", date_queries)
+    results = {query: {} for query in date_queries}
+
+    try:
+        found = await _run_blocking(_search_special_days_batch, date_queries)
+    except Exception as e:
+        logging.error("Error fetching special day info via batch tool for %s: %s", date_queries, e)
+        return results
+    # `found` only holds queries whose search succeeded (or came from the cache)
+    _note_search_succeeded(found)
+
+    # Variant queries tend to find the same days; report each one only once
+    seen = set()
+    for query in results:
+        results[query] = _dedupe_special_days(found.get(query, {}), seen)
+    return results
+
+def _build_search_query(date_query: str) -> str:
+    """Builds the Custom Search query string for a date query."""
     # Refined search query for better precision
-    search_query = f"international OR world OR national day {date_query} official observances"
-    logging.info(f"{search_query=}")
+    return f"international OR world OR national day {date_query} official observances"
 
-    res = service.cse().list(q=search_query, cx=GOOGLE_CSE_ID, num=5).execute()
+# Partial-response selector: only the fields _extract_special_days reads are requested
+CSE_RESPONSE_FIELDS = "items(title,snippet)"
 
+# Titles of relevant results mention days, holidays, observances or awareness events as
+# whole words (singular or plural, e.g. "National Days Calendar", "Holidays and observances
+# on May 21"). Words that merely contain "day", such as "Today" or "Sunday", do not count.
+_TITLE_RE = re.compile(r'\b(day|holiday|observance|awareness)s?\b', re.IGNORECASE)
+
+def _extract_special_days(res: dict) -> dict:
+    """Filters a Custom Search response down to {day title: short description}."""
+    results = {}
     if 'items' in res:
         for item in res['items']:
             title = item.get('title')
             snippet = item.get('snippet')
             # Basic filtering to ensure relevant results, focusing on 'day' in title
-            if title and snippet and ("day" in title.lower() or "observance" in title.lower()):
+            if title and snippet and _TITLE_RE.search(title):
                 # Try to extract a concise description, handling potential list formats in snippets
-                description = snippet.split('...')[0].strip()
-                if title not in results:
-                    results[title] = description
-    logging.info(f"Google Custom Search API returned {len(results)} results.")
+                results.setdefault(title, snippet.partition('...')[0].strip())
+    # Merge titles that only differ from an earlier one in case or spacing
+    return _dedupe_special_days(results, set())
+
+# Titles are compared the same way queries are: lowercased with whitespace collapsed
+_normalize_title = _normalize_query
+
+def _dedupe_special_days(days: dict, seen: set) -> dict:
+    """
+    Returns `days` without titles whose normalized form is already in `seen`,
+    adding the titles it keeps to `seen`.
+    """
+    unique = {}
+    for title, description in days.items():
+        norm = _normalize_title(title)
+        if norm in seen:
+            continue
+        seen.add(norm)
+        unique[title] = description
+    return unique
+
+def _search_special_days(date_query: str) -> dict:
+    """
+    Helper function to retrieve special day information from Google Custom Search API.
+    Raises exceptions on API errors, which are caught by the calling tool function.
+    """
+    cache_key = _normalize_query(date_query)
+    cached = _load_cached(cache_key)
+    if cached is not None:
+        logging.info("Cache hit for '%s': returning %s cached results.", cache_key, len(cached))
+        return cached
+
+    logging.info("Attempting to use Google Custom Search API for special days...")
+    service = _get_cse_service()
+    search_query = _build_search_query(date_query)
+    logging.info("search_query=%r", search_query)
+
+    res = service.cse().list(q=search_query, cx=GOOGLE_CSE_ID, num=5,
+                             fields=CSE_RESPONSE_FIELDS).execute(http=_get_thread_http())
+
+    results = _extract_special_days(res)
+    logging.info("Google Custom Search API returned %s results.", len(results))
+    _store_cached(cache_key, results)
+    return results
+
+def _search_special_days_batch(date_queries: list[str]) -> dict:
+    """
+    Helper function that resolves several date queries at once. Cached queries are
+    served from disk; the rest are sent to Google Custom Search as one batch request.
+    Queries whose individual request fails are logged and left out of the result.
+    """
+    results = {}
+    hits = {}     # normalized query (the cache key) -> cached results
+    pending = {}  # normalized query (the cache key) -> raw date queries that map to it
+    for date_query in date_queries:
+        cache_key = _normalize_query(date_query)
+        if cache_key in pending:
+            pending[cache_key].append(date_query)
+            continue
+        if cache_key not in hits:
+            cached = _load_cached(cache_key)
+            if cached is None:
+                pending[cache_key] = [date_query]
+                continue
+            logging.info("Cache hit for '%s': returning %s cached results.", cache_key, len(cached))
+            hits[cache_key] = cached
+        results[date_query] = hits[cache_key]
+
+    if not pending:
+        return results
+
+    request_keys = dict(enumerate(pending))  # batch request_id -> normalized query
+    succeeded = []  # normalized queries whose sub-request succeeded
+
+    def _on_response(request_id, response, exception):
+        cache_key = request_keys[int(request_id)]
+        if exception is not None:
+            logging.error("Batched search for '%s' failed: %s", cache_key, exception)
+            return
+        succeeded.append(cache_key)
+        days = _extract_special_days(response)
+        _store_cached(cache_key, days)
+        for date_query in pending[cache_key]:
+            results[date_query] = days
+
+    logging.info("Attempting to use Google Custom Search API for %s batched sub-requests...", len(pending))
+    service = _get_cse_service()
+    batch = service.new_batch_http_request(callback=_on_response)
+    for request_id, cache_key in request_keys.items():
+        batch.add(service.cse().list(q=_build_search_query(pending[cache_key][0]), cx=GOOGLE_CSE_ID, num=5,
+                                     fields=CSE_RESPONSE_FIELDS),
+                  request_id=str(request_id))
+    batch.execute(http=_get_thread_http())
+
+    logging.info("Google Custom Search API batch: %s of %s sub-requests succeeded.", len(succeeded), len(pending))
     return results
 
 # Register your special day search function as an ADK tool
 # CORRECTED: Removed 'name' and 'description' keyword arguments as FunctionTool doesn't accept them.
+# FunctionTool awaits coroutine functions, so the async tool is registered the same way.
 special_day_search_tool = FunctionTool(get_special_day_info_from_external_source)
+special_day_batch_search_tool = FunctionTool(get_special_day_info_batch)
+
+# --- Agent Configuration ---
+# These never change between runs, so they are built once at import time and
+# shared by every SpecialDayAgent instance.
+_INSTRUCTION = """
+Your primary task is to identify if today is a special occasion (international, national, or awareness day).
+**First, you MUST use the 'get_special_day_info_from_external_source' tool.**
+To do this, use the current date provided in the prompt (e.g., 'May 21') and pass it as the `date_query` argument to the tool.
+If you want to check several variants of the date at once (e.g., 'May 21', 'May 21 India', 'May 21 awareness'),
+prefer the 'get_special_day_info_batch' tool and pass them all together as `date_queries` in a single call.
+
+Based on the tool's results:
+- If special days are found:
+    - For each special day, clearly state its **Title** and a brief **Description**.
+    - Then, craft a warm, fresh, and inspiring message about the day's theme.
+    - Finally, create a simple, concise visual representation (e.g., emojis or a short symbolic phrase) of the day with appropriate colors and symbols.
+- If the tool reports no special days (returns an empty dictionary or an error was logged during tool execution), simply state that no widely recognized special or international days are observed today based on your current information.
+
+Keep your messages meaningful and your visual representations simple and relevant.
+"""
+
+_TOOLS = [special_day_search_tool, special_day_batch_search_tool]
+
+_SAFETY_SETTINGS = {
+    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+}
+
+# Pinned sampling settings: together with the date-free _INSTRUCTION above, every run
+# sends the model the same prefix, which lets Vertex AI serve it from its prompt cache
+_GENERATION_CONFIG = types.GenerateContentConfig(
+    temperature=0.2,
+    top_p=0.9,
+    candidate_count=1,
+    max_output_tokens=512,
+)
+
+# Stream the response so the greeting is printed as it is generated
+_RUN_CONFIG = RunConfig(streaming_mode=StreamingMode.SSE)
+
+# The date is injected here rather than in the instruction; $md is the "Month Day" for tool queries
+_PROMPT_TMPL = string.Template(
+    "Hello! Today's full date is $full. "
+    "The current 'Month Day' for tool queries is '$md'. "
+    "Please check for special or international days and generate greetings."
+)
 
 # --- 4. Agent Definition ---
+def _talker_loop(output_queue: queue.Queue) -> None:
+    """
+    Talker thread: prints whatever the agent run (the thinker) pushes onto the
+    queue as soon as it arrives, until it receives None. This keeps user-visible
+    output flowing while the thinker is still waiting on the model or a tool.
+    """
+    while (text := output_queue.get()) is not None:
+        print(text, end="", flush=True)
+
+class _DailyCheckRun:
+    """Per-run state of one run_daily_check call, shared by that run's event handlers."""
+
+    def __init__(self, output_queue: queue.Queue, greeting_cache_key: str, search_cache_key: str):
+        self.output_queue = output_queue
+        self.greeting_cache_key = greeting_cache_key
+        self.search_cache_key = search_cache_key
+        self.streamed = False  # True once the first response chunk has been queued
+        self.search_succeeded = False  # True once a tool call for today's query got real search results
+
 class SpecialDayAgent:
+    # (date ordinal, "Month Day", "Month Day, Year") for the last date formatted, shared
+    # across instances so repeated checks on the same day skip the strftime calls
+    _cached_date_strings = None
+
     def __init__(self, model_name: str = "gemini-pro"):
         """
         Initializes the ADK LlmAgent, setting up its model, instructions, and tools.
@@ -108,69 +486,131 @@ class SpecialDayAgent:
             name="special_day_agent",
             model=model_name,
             description="A helpful assistant that identifies special days using a tool and generates creative messages.",
-            instruction="""
-            Your primary task is to identify if today is a special occasion (international, national, or awareness day).
-            **First, you MUST use the 'get_special_day_info_from_external_source' tool.**
-            To do this, use the current date provided in the prompt (e.g., 'May 21') and pass it as the `date_query` argument to the tool.
-
-            Based on the tool's results:
-            - If special days are found:
-                - For each special day, clearly state its **Title** and a brief **Description**.
-                - Then, craft a warm, fresh, and inspiring message about the day's theme.
-                - Finally, create a simple, concise visual representation (e.g., emojis or a short symbolic phrase) of the day with appropriate colors and symbols.
-            - If the tool reports no special days (returns an empty dictionary or an error was logged during tool execution), simply state that no widely recognized special or international days are observed today based on your current information.
-
-            Keep your messages meaningful and your visual representations simple and relevant.
-            """,
-            tools=[special_day_search_tool],
-            safety_settings={
-                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARMS_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARMS_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARMS_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-            }
+            instruction=_INSTRUCTION,
+            tools=_TOOLS,
+            safety_settings=_SAFETY_SETTINGS,
+            generate_content_config=_GENERATION_CONFIG,
         )
         self.runner = Runner(self.agent)
+        self.run_config = _RUN_CONFIG
+        # ADK event type -> handler. Each handler takes the run's _DailyCheckRun and the event,
+        # and returns True when the run is finished. Per-run state lives in the _DailyCheckRun,
+        # so concurrent run_daily_check calls on one instance do not interfere.
+        self._handlers = {
+            "tool_code": self._h_tool_code,
+            "tool_response": self._h_tool_resp,
+            "agent_response": self._h_agent_resp,
+            "error": self._h_error,
+        }
 
-    def run_daily_check(self):
+    @classmethod
+    def _date_strings(cls, date: datetime.date) -> tuple:
+        """Returns ("May 21", "May 21, 2025")-style strings for `date`, reusing them for the same day."""
+        cached = cls._cached_date_strings
+        if cached is None or cached[0] != date.toordinal():
+            month_day = date.strftime('%B %d')
+            cached = cls._cached_date_strings = (date.toordinal(), month_day, f"{month_day}, {date.year}")
+        return cached[1], cached[2]
+
+    async def run_daily_check(self):
         """
         Executes the ADK agent's daily check. The agent will orchestrate its own
-        tool calls based on its instructions.
+        tool calls based on its instructions, and its response is printed chunk
+        by chunk as it streams in.
         """
         current_date_obj = datetime.date.today()
         # Explicitly provide the "Month Day" format for the tool call guidance
-        current_date_formatted = current_date_obj.strftime('%B %d') # e.g., "May 21"
-        initial_prompt = (f"Hello! Today's full date is {current_date_obj.strftime('%B %d, %Y')}. "
-                          f"The current 'Month Day' for tool queries is '{current_date_formatted}'. "
-                          "Please check for special or international days and generate greetings.")
+        current_date_formatted, current_date_full = self._date_strings(current_date_obj)
+        print(f"\n--- Running ADK Special Day Agent for {current_date_full} ---")
+
+        # In offline mode, a greeting already generated today is reused without calling the model,
+        # as long as today's search results are cached too. Greetings are only stored by runs
+        # whose search for today succeeded (see _h_agent_resp).
+        greeting_cache_key = current_date_obj.isoformat()
+        search_cache_key = _normalize_query(current_date_formatted)
+        if GREETING_AGENT_OFFLINE and _load_cached(search_cache_key) is not None:
+            cached_greeting = _load_cached(greeting_cache_key, namespace="greeting")
+            if cached_greeting is not None:
+                logging.info("Offline mode: serving cached greeting for %s", current_date_obj)
+                print("\n--- Agent's Final Output (cached) ---")
+                print(cached_greeting)
+                return
+
+        # Overlap the search the agent is about to request with the model's first step
+        _discard_prefetched()
+        _prefetch_special_days(current_date_formatted)
+        initial_prompt = _PROMPT_TMPL.substitute(full=current_date_full, md=current_date_formatted)
+        logging.info("Agent's initial prompt: %s", initial_prompt)
 
-        print(f"\n--- Running ADK Special Day Agent for {current_date_obj.strftime('%B %d, %Y')} ---")
-        logging.info(f"Agent's initial prompt: {initial_prompt}")
+        # Hand all user-visible output to the talker thread, starting with an immediate
+        # acknowledgement, so the user sees progress while the search and generation run.
+        output_queue = queue.Queue()
+        talker = threading.Thread(target=_talker_loop, args=(output_queue,), name="talker", daemon=True)
+        talker.start()
+        output_queue.put("Checking today's observances...\n")
 
+        run = _DailyCheckRun(output_queue, greeting_cache_key, search_cache_key)
+        handlers = {event_type: functools.partial(handler, run) for event_type, handler in self._handlers.items()}
+        run_token = _CURRENT_RUN.set(run)
         try:
-            for event in self.runner.run(initial_prompt):
-                if event.type == "tool_code":
-                    logging.info(f"ADK Event: Agent called tool: {event.tool_code.tool_name} with args: {event.tool_code.args}")
-                    print(f"DEBUG: Agent decided to use tool: {event.tool_code.tool_name} with arguments {event.tool_code.args}")
-                elif event.type == "tool_response":
-                    logging.info(f"ADK Event: Tool response: {event.tool_response.output}")
-                    print(f"DEBUG: Tool returned: {event.tool_response.output}")
-                elif event.type == "agent_response":
-                    print("\n--- Agent's Final Output ---")
-                    print(event.agent_response.text)
-                    break
-                elif event.type == "error":
-                    logging.error(f"ADK Event: An error occurred during agent execution: {event.error.message}")
-                    print(f"Agent encountered an error: {event.error.message}")
+            async for event in self.runner.run_async(initial_prompt, run_config=self.run_config):
+                handler = handlers.get(event.type)
+                if handler and handler(event):
                     break
         except Exception as e:
             logging.exception("Unhandled error during ADK agent run.")
-            print(f"An unhandled error occurred during ADK agent run: {e}")
+            output_queue.put(f"An unhandled error occurred during ADK agent run: {e}\n")
+        finally:
+            # Let the talker drain everything queued so far before returning
+            output_queue.put(None)
+            talker.join()
+            _CURRENT_RUN.reset(run_token)
+            # The prefetch is only valid for this run, e.g. if the model used the batch tool instead
+            _discard_prefetched()
+
+    # --- ADK event handlers ---
+    def _h_tool_code(self, run: _DailyCheckRun, event) -> bool:
+        """Reports that the agent decided to call a tool."""
+        logging.info("ADK Event: Agent called tool: %s with args: %s", event.tool_code.tool_name, event.tool_code.args)
+        run.output_queue.put(f"DEBUG: Agent decided to use tool: {event.tool_code.tool_name} with arguments {event.tool_code.args}\n")
+        return False
+
+    def _h_tool_resp(self, run: _DailyCheckRun, event) -> bool:
+        """Reports what a tool returned."""
+        logging.info("ADK Event: Tool response: %s", event.tool_response.output)
+        run.output_queue.put(f"DEBUG: Tool returned: {event.tool_response.output}\n")
+        return False
+
+    def _h_agent_resp(self, run: _DailyCheckRun, event) -> bool:
+        """Passes on streamed response chunks and finishes the run on the final response."""
+        if event.partial:
+            # Streamed chunk: pass it on as soon as it arrives
+            if not run.streamed:
+                run.output_queue.put("\n--- Agent's Final Output ---\n")
+                run.streamed = True
+            run.output_queue.put(event.agent_response.text)
+            return False
+        # Only keep greetings the model wrote from a successful search for today; after a failed
+        # search the tool returns {} and the model reports no special days, which must not be replayed
+        if run.search_succeeded:
+            _store_cached(run.greeting_cache_key, event.agent_response.text, namespace="greeting")
+        # The final event carries the full text, which was already printed if it streamed
+        if run.streamed:
+            run.output_queue.put("\n")
+        else:
+            run.output_queue.put(f"\n--- Agent's Final Output ---\n{event.agent_response.text}\n")
+        return True
+
+    def _h_error(self, run: _DailyCheckRun, event) -> bool:
+        """Reports an agent error and finishes the run."""
+        logging.error("ADK Event: An error occurred during agent execution: %s", event.error.message)
+        run.output_queue.put(f"Agent encountered an error: {event.error.message}\n")
+        return True
 
 # --- 5. Main Execution Block ---
 if __name__ == "__main__":
     # Ensure you've followed ALL the setup steps in the README.md:
-    # 1. Install Python libraries: pip install dotenv google-adk google-api-python-client google-generativeai
+    # 1. Install Python libraries: pip install dotenv google-adk google-api-python-client google-generativeai orjson
     # 2. Configure Google Cloud Project and enable APIs (Vertex AI, Custom Search API).
     # 3. Authenticate with gcloud auth application-default login.
     # 4. Set environment variables in your .env file.
@@ -179,6 +619,6 @@ if __name__ == "__main__":
     #    and GOOGLE_CSE_ID are correctly set in your .env.
 
     special_day_agent_instance = SpecialDayAgent(model_name="gemini-pro")
-    special_day_agent_instance.run_daily_check()
+    asyncio.run(special_day_agent_instance.run_daily_check())
 
     print("\n--- ADK Agent execution complete. ---")
\ No newline at end of file